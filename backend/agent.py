@@ -1,5 +1,6 @@
 from detector import detect_image, detect_video
-from llm_service import generate_analysis_explanation
+import json
+from llm_service import generate_analysis_explanation, stream_analysis_explanation
 
 def deepfake_agent(file, file_type, technical_level="intermediate"):
     """
@@ -33,3 +34,37 @@ def deepfake_agent(file, file_type, technical_level="intermediate"):
     # Step 3: Combine results
     detection_result["explanation"] = explanation
     return detection_result
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def deepfake_agent_stream(file, file_type, technical_level="intermediate"):
+    """
+    Same as deepfake_agent, but yields Server-Sent Events so the client can render the
+    LLM explanation as it is generated.
+
+    Yields:
+        a "detection" event with the detection result, one "explanation" event per
+        text chunk, then a "done" event (or a single "error" event)
+    """
+    if file_type.startswith("image/"):
+        detection_result = detect_image(file)
+    elif file_type.startswith("video/"):
+        detection_result = detect_video(file)
+    else:
+        yield _sse("error", {"error": "Unsupported file type"})
+        return
+
+    yield _sse("detection", detection_result)
+
+    filename = getattr(file, 'filename', 'uploaded_file')
+    try:
+        for chunk in stream_analysis_explanation(detection_result, filename, technical_level):
+            yield _sse("explanation", {"content": chunk})
+    except Exception as e:
+        print("LLM explanation failed:", str(e))
+        yield _sse("explanation", {"content": "LLM explanation failed. Core detection succeeded."})
+
+    yield _sse("done", {})
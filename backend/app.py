@@ -1,7 +1,8 @@
-from flask import Flask, request, jsonify
+import os
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
-from detector import detect_image, detect_video
-from agent import deepfake_agent  # Includes LLM explanation
+from detector import detect_image, detect_video, warmup
+from agent import deepfake_agent, deepfake_agent_stream  # Includes LLM explanation
 
 app = Flask(__name__)
 CORS(app)
@@ -45,5 +46,22 @@ def agent_detect():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# Same as /api/agent-detect, streamed as Server-Sent Events for low time-to-first-token
+@app.route("/api/agent-detect/stream", methods=["POST"])
+def agent_detect_stream():
+    if 'file' not in request.files:
+        return jsonify({"error": "No file uploaded"}), 400
+
+    file = request.files['file']
+    file_type = file.content_type
+
+    return Response(
+        stream_with_context(deepfake_agent_stream(file, file_type)),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
+    )
+
+# Development server only; production runs under gunicorn (see gunicorn.conf.py)
 if __name__ == "__main__":
-    app.run(debug=True, port=5000)
+    warmup()
+    app.run(debug=os.getenv("FLASK_DEBUG") == "1", port=5000)
@@ -0,0 +1,29 @@
+# Production server config. Run from backend/ with: gunicorn -c gunicorn.conf.py app:app
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:5000")
+
+# Threads cover the I/O-bound LLM waits within each worker
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+
+# Load the model once in the master and share it copy-on-write across forked workers
+preload_app = True
+os.environ.setdefault("MODEL_LOAD_DEVICE", "cpu")
+# model_registry calls torch.cuda.is_available() in the master. The default check initialises
+# the CUDA driver, after which every forked worker fails with "Cannot re-initialize CUDA in
+# forked subprocess"; the NVML-based check answers without touching the driver.
+os.environ.setdefault("PYTORCH_NVML_BASED_CUDA_CHECK", "1")
+
+# Video detection plus the LLM explanation can take a while
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+
+
+def post_fork(server, worker):
+    # CUDA contexts can't cross fork, so each worker moves the preloaded weights onto the GPU itself
+    from model_registry import move_model_to_device
+    move_model_to_device()
+    # Compile both input shapes now rather than on the first live requests
+    from detector import warmup
+    warmup()
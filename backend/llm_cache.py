@@ -0,0 +1,215 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Protocol
+
+import numpy as np
+
+EMBEDDING_MODEL = os.getenv("LLM_CACHE_EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+SIMILARITY_THRESHOLD = float(os.getenv("LLM_CACHE_THRESHOLD", "0.92"))
+CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "3600"))
+MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2048"))
+EXACT_CACHE_SIZE = int(os.getenv("LLM_EXACT_CACHE_SIZE", "4096"))
+
+# Numbers are masked out of the embedded text so they never drive a similarity match
+NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+
+
+def cache_key(model, messages, partition=None):
+    """Exact-match key for a chat completion request."""
+    payload = json.dumps({"model": model, "messages": messages, "partition": partition}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _token_pattern(value):
+    # Whole tokens only, so "87.3" doesn't match inside "187.35"
+    return re.compile(r"(?<![\w.])" + re.escape(value) + r"(?!\w)")
+
+
+def to_template(text, variables):
+    """
+    Replace each variable's value in text with its {{name}} placeholder. Values match whole
+    tokens only; pass a quoted value (e.g. '"blob"') to leave unquoted uses of the word alone.
+    """
+    for name, value in sorted(variables.items(), key=lambda item: -len(item[1])):
+        if value:
+            text = _token_pattern(value).sub(lambda _: "{{" + name + "}}", text)
+    return text
+
+
+def leaks_variable(text, variables):
+    """Whether text still contains a variable's bare value (quotes stripped) after templating."""
+    return any(value.strip('"') in text for value in variables.values() if value.strip('"'))
+
+
+def from_template(text, variables):
+    """Fill {{name}} placeholders in text with the variables' values."""
+    for name, value in variables.items():
+        text = text.replace("{{" + name + "}}", value)
+    return text
+
+
+class CacheBackend(Protocol):
+    """Key/value store for exact-match completions (in-memory here, e.g. Redis when deployed)."""
+
+    def get(self, key: str) -> Optional[str]: ...
+
+    def set(self, key: str, value: str) -> None: ...
+
+
+class LRUCache:
+    """Thread-safe in-memory CacheBackend with least-recently-used eviction and a TTL."""
+
+    def __init__(self, maxsize=EXACT_CACHE_SIZE, ttl=CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            expires, value = self._data[key]
+            if expires < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.time() + self.ttl, value)
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+class SemanticCache:
+    """
+    Cache of LLM completions, looked up first by exact prompt hash in a CacheBackend and then
+    by cosine similarity between in-memory sentence embeddings of the prompt.
+
+    Entries are grouped by a caller-supplied partition (e.g. label, confidence bucket and
+    technical level) and similarity is only compared within the same partition. Per-request
+    values such as filenames are passed as variables: they are swapped for placeholders before
+    hashing, embedding and storing, and filled back in on a hit.
+    """
+
+    def __init__(self, model_name=EMBEDDING_MODEL, threshold=SIMILARITY_THRESHOLD,
+                 ttl=CACHE_TTL, max_entries=MAX_ENTRIES, exact: Optional[CacheBackend] = None):
+        self.model_name = model_name
+        self.exact = exact if exact is not None else LRUCache(ttl=ttl)
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self._encoder = None
+        self._encoder_failed = False
+        # Loading the encoder can download it, so only one thread may attempt it
+        self._encoder_lock = threading.Lock()
+        self._lock = threading.Lock()
+
+        # Parallel arrays: row i of _embeddings belongs to _keys[i]/_responses[i]/_created[i]/_partitions[i]
+        self._embeddings = None
+        self._keys = []
+        self._responses = []
+        self._created = []
+        self._partitions = []
+
+    def _get_encoder(self):
+        with self._encoder_lock:
+            if self._encoder is None and not self._encoder_failed:
+                try:
+                    from sentence_transformers import SentenceTransformer
+                    self._encoder = SentenceTransformer(self.model_name)
+                except Exception as e:
+                    print("Semantic cache disabled:", e)
+                    self._encoder_failed = True
+        return self._encoder
+
+    def _encode(self, model, messages):
+        encoder = self._get_encoder()
+        if encoder is None:
+            return None
+
+        text = f"{model}\n" + "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+        return encoder.encode(NUMBER_RE.sub("#", text), normalize_embeddings=True).astype(np.float32)
+
+    def _evict_expired(self):
+        cutoff = time.time() - self.ttl
+        keep = [i for i, created in enumerate(self._created) if created >= cutoff]
+        # Also drop the oldest entries once the cache is over capacity
+        keep = keep[-self.max_entries:]
+        if len(keep) == len(self._keys):
+            return
+
+        self._keys = [self._keys[i] for i in keep]
+        self._responses = [self._responses[i] for i in keep]
+        self._created = [self._created[i] for i in keep]
+        self._partitions = [self._partitions[i] for i in keep]
+        if self._embeddings is not None:
+            self._embeddings = self._embeddings[keep]
+
+    @staticmethod
+    def _templated(messages, variables):
+        return [{**m, "content": to_template(m["content"], variables)} for m in messages]
+
+    def get(self, model, messages, partition=None, variables=None):
+        """Return a cached completion for a matching prompt in the same partition, or None."""
+        variables = variables or {}
+        messages = self._templated(messages, variables)
+        key = cache_key(model, messages, partition)
+        cached = self.exact.get(key)
+        if cached is not None:
+            return from_template(cached, variables)
+
+        with self._lock:
+            self._evict_expired()
+            if partition not in self._partitions:
+                return None
+
+        embedding = self._encode(model, messages)
+        if embedding is None:
+            return None
+
+        with self._lock:
+            if self._embeddings is None:
+                return None
+            candidates = [i for i, p in enumerate(self._partitions) if p == partition]
+            if not candidates:
+                return None
+            scores = self._embeddings[candidates] @ embedding
+            best = int(scores.argmax())
+            if scores[best] >= self.threshold:
+                return from_template(self._responses[candidates[best]], variables)
+        return None
+
+    def set(self, model, messages, response, partition=None, variables=None):
+        """Store a completion for the given prompt."""
+        variables = variables or {}
+        messages = self._templated(messages, variables)
+        key = cache_key(model, messages, partition)
+        response = to_template(response, variables)
+        # Any value left outside its templated form (e.g. an unquoted filename) would be served
+        # to other requests, so such responses aren't cached
+        if leaks_variable(response, variables):
+            return
+        self.exact.set(key, response)
+        embedding = self._encode(model, messages)
+
+        with self._lock:
+            if key in self._keys:
+                return
+            if embedding is not None:
+                row = embedding[np.newaxis, :]
+                self._embeddings = row if self._embeddings is None else np.vstack([self._embeddings, row])
+            self._keys.append(key)
+            self._responses.append(response)
+            self._created.append(time.time())
+            self._partitions.append(partition)
+            self._evict_expired()
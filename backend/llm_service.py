@@ -1,9 +1,17 @@
+import json
 import os
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from llm_cache import SemanticCache
 
 API_KEY = os.getenv("GMI_API_KEY")
 API_URL = os.getenv("GMI_API_URL", "https://api.gmi.cloud/v1/chat/completions")
 
+# Shared session so LLM calls reuse pooled keep-alive connections instead of a new TCP+TLS handshake each time
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=16, max_retries=Retry(total=2, backoff_factor=0.2)))
+
 SYSTEM_PROMPTS = {
     "analysis": "You are DeepShield AI, a forensic expert in deepfake detection. Provide detailed, professional analysis of detection results in clear, educational language.",
     "educational": "You are DeepShield AI, an expert educator in AI security and deepfake detection. Explain complex concepts clearly and adapt to the user's technical level.",
@@ -18,11 +26,17 @@ FALLBACKS = {
     "conversational": "I'm DeepShield AI, your assistant in spotting and explaining deepfakes. Ask me anything about media security!"
 }
 
+response_cache = SemanticCache()
+
+# Width, in percentage points, of the confidence buckets that partition cached analysis reports
+CONFIDENCE_BUCKET = 5
 
-def generate_response(prompt, intent="conversational", context=[]):
+
+def _build_request(prompt, intent, context):
     headers = {
         "Authorization": f"Bearer {API_KEY}",
-        "Content-Type": "application/json"
+        "Content-Type": "application/json",
+        "Connection": "keep-alive"
     }
 
     messages = [
@@ -35,18 +49,91 @@ def generate_response(prompt, intent="conversational", context=[]):
         "max_tokens": 600,
         "temperature": 0.7
     }
+    return headers, body
+
 
+def _cached_response(body, use_cache, cache_scope):
+    if use_cache:
+        partition, variables = cache_scope or (None, None)
+        return response_cache.get(body["model"], body["messages"], partition, variables)
+    return None
+
+
+def _cache_response(body, use_cache, cache_scope, content):
+    # A caching failure must never cost the caller a completion it already has
     try:
-        response = requests.post(API_URL, headers=headers, json=body)
+        if use_cache:
+            partition, variables = cache_scope or (None, None)
+            response_cache.set(body["model"], body["messages"], content, partition, variables)
+    except Exception as e:
+        print("LLM cache error:", e)
+
+
+def generate_response(prompt, intent="conversational", context=[], use_cache=False, cache_scope=None):
+    """
+    cache_scope is an optional (partition, variables) pair for the semantic cache: similarity is
+    only compared within the partition, and variables (name -> value) are kept out of cached text.
+    """
+    headers, body = _build_request(prompt, intent, context)
+
+    cached = _cached_response(body, use_cache, cache_scope)
+    if cached is not None:
+        return cached
+
+    try:
+        response = SESSION.post(API_URL, headers=headers, json=body, timeout=(3, 30))
         response.raise_for_status()
         data = response.json()
-        return data.get("choices", [{}])[0].get("message", {}).get("content", FALLBACKS[intent])
+        content = data.get("choices", [{}])[0].get("message", {}).get("content")
     except Exception as e:
         print("LLM error:", e)
         return FALLBACKS[intent]
 
+    if not content:
+        return FALLBACKS[intent]
+    _cache_response(body, use_cache, cache_scope, content)
+    return content
 
-def generate_analysis_explanation(result, filename, technical_level="intermediate"):
+
+def stream_response(prompt, intent="conversational", context=[], use_cache=False, cache_scope=None):
+    """Yield the completion as text chunks as they arrive from the chat-completions stream."""
+    headers, body = _build_request(prompt, intent, context)
+
+    cached = _cached_response(body, use_cache, cache_scope)
+    if cached is not None:
+        yield cached
+        return
+
+    body["stream"] = True
+    chunks = []
+    try:
+        with SESSION.post(API_URL, headers=headers, json=body, timeout=(3, 30), stream=True) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line.startswith(b"data:"):
+                    continue
+                data = line[len(b"data:"):].strip()
+                if data == b"[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or [{}]
+                delta = choices[0].get("delta", {}).get("content")
+                if delta:
+                    chunks.append(delta)
+                    yield delta
+    except Exception as e:
+        print("LLM error:", e)
+        if not chunks:
+            yield FALLBACKS[intent]
+        return
+
+    if not chunks:
+        yield FALLBACKS[intent]
+        return
+    del body["stream"]
+    _cache_response(body, use_cache, cache_scope, "".join(chunks))
+
+
+def build_analysis_prompt(result, filename, technical_level="intermediate"):
     confidence = f"{result.get('confidence', 0) * 100:.1f}"
     is_deepfake = "DEEPFAKE DETECTED" if result.get("label", "").lower() == "fake" else "AUTHENTIC CONTENT"
     artifacts = result.get("artifacts", [])
@@ -54,7 +141,7 @@ def generate_analysis_explanation(result, filename, technical_level="intermediat
     artifact_summary = ", ".join(a.get("type", "unknown") for a in artifacts) or "None detected"
     artifact_details = "; ".join(f"{a.get('type')}: {a.get('score', 0)*100:.1f}%" for a in artifacts) or "No artifacts to report."
 
-    prompt = (
+    return (
         f"Analysis Results for \"{filename}\":\n"
         f"- Classification: {is_deepfake}\n"
         f"- Confidence Score: {confidence}%\n"
@@ -70,4 +157,30 @@ def generate_analysis_explanation(result, filename, technical_level="intermediat
         f"Adapt the technical depth to the user's level: {technical_level}."
     )
 
-    return generate_response(prompt, "analysis")
+
+def analysis_cache_scope(result, filename, technical_level="intermediate"):
+    """
+    Semantic-cache scope for an analysis report: partitioned by (media type, label, confidence
+    bucket, technical level), with the filename and exact confidence substituted back in on a hit.
+    The filename is only templated where it appears quoted, as the prompt writes it.
+    """
+    confidence = result.get("confidence", 0) * 100
+    partition = (
+        result.get("type"),
+        result.get("label", "").lower(),
+        int(confidence // CONFIDENCE_BUCKET),
+        technical_level
+    )
+    return partition, {"filename": f'"{filename}"', "confidence": f"{confidence:.1f}"}
+
+
+def generate_analysis_explanation(result, filename, technical_level="intermediate"):
+    prompt = build_analysis_prompt(result, filename, technical_level)
+    scope = analysis_cache_scope(result, filename, technical_level)
+    return generate_response(prompt, "analysis", use_cache=True, cache_scope=scope)
+
+
+def stream_analysis_explanation(result, filename, technical_level="intermediate"):
+    prompt = build_analysis_prompt(result, filename, technical_level)
+    scope = analysis_cache_scope(result, filename, technical_level)
+    return stream_response(prompt, "analysis", use_cache=True, cache_scope=scope)
@@ -0,0 +1,100 @@
+import os
+from functools import lru_cache
+
+import torch
+from huggingface_hub import snapshot_download
+from transformers import AutoImageProcessor, AutoModelForImageClassification
+
+MODEL_ID = 'ashish-001/deepfake-detection-using-ViT'
+# Bake weights (and the ONNX export) into this directory at build time (`python model_registry.py`)
+# so startup never hits the network
+MODELS_DIR = os.getenv("MODELS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "models"))
+
+device = "cuda" if torch.cuda.is_available() else "cpu"
+# Where get_model() first places the weights. gunicorn.conf.py sets this to "cpu" so the preloaded
+# master never creates a CUDA context (which can't survive fork); workers then call move_model_to_device().
+load_device = os.getenv("MODEL_LOAD_DEVICE", device)
+
+
+def model_path(repo_id=MODEL_ID) -> str:
+    return os.path.join(MODELS_DIR, repo_id.replace("/", "--"))
+
+
+def onnx_path(repo_id=MODEL_ID) -> str:
+    return os.path.join(model_path(repo_id), "model.onnx")
+
+
+def download_model(repo_id=MODEL_ID) -> str:
+    """Download model weights (safetensors preferred) into MODELS_DIR."""
+    return snapshot_download(repo_id, local_dir=model_path(repo_id))
+
+
+@lru_cache(maxsize=None)
+def get_model(repo_id=MODEL_ID):
+    """
+    Load the image processor and classification model once per process.
+
+    Returns:
+        (image_processor, model) with the model on `load_device` in eval mode
+    """
+    path = model_path(repo_id)
+    if not os.path.isdir(path):
+        download_model(repo_id)
+
+    image_processor = AutoImageProcessor.from_pretrained(path, local_files_only=True)
+    model = AutoModelForImageClassification.from_pretrained(
+        path,
+        local_files_only=True,
+        torch_dtype=torch.float16 if device == "cuda" else torch.float32
+    ).to(load_device).eval()
+    return image_processor, model
+
+
+def export_onnx(repo_id=MODEL_ID) -> str:
+    """Export the classifier to ONNX with a dynamic batch dimension, next to its weights."""
+    path = model_path(repo_id)
+    image_processor = AutoImageProcessor.from_pretrained(path, local_files_only=True)
+    model = AutoModelForImageClassification.from_pretrained(path, local_files_only=True, return_dict=False).eval()
+
+    dummy = torch.zeros(1, 3, image_processor.size["height"], image_processor.size["width"])
+    torch.onnx.export(
+        model,
+        (dummy,),
+        onnx_path(repo_id),
+        input_names=["pixel_values"],
+        output_names=["logits"],
+        dynamic_axes={"pixel_values": {0: "batch"}, "logits": {0: "batch"}},
+        opset_version=17
+    )
+    return onnx_path(repo_id)
+
+
+@lru_cache(maxsize=None)
+def get_onnx_session(repo_id=MODEL_ID):
+    """
+    ONNX Runtime session for CPU inference.
+
+    Returns:
+        an InferenceSession, or None if onnxruntime or the exported model is unavailable
+    """
+    if not os.path.isfile(onnx_path(repo_id)):
+        return None
+    try:
+        import onnxruntime as ort
+    except ImportError:
+        return None
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return ort.InferenceSession(onnx_path(repo_id), options, providers=["CPUExecutionProvider"])
+
+
+def move_model_to_device(repo_id=MODEL_ID):
+    """Move a model loaded on `load_device` onto the inference `device` (in place)."""
+    _, model = get_model(repo_id)
+    model.to(device)
+
+
+if __name__ == "__main__":
+    print(f"Model saved to {download_model()}")
+    print(f"ONNX export saved to {export_onnx()}")
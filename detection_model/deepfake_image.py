@@ -4,16 +4,19 @@ from PIL import Image
 import os
 import glob
 
+device = "cuda" if torch.cuda.is_available() else "cpu"
+
 def load_model():
     image_processor = AutoImageProcessor.from_pretrained('ashish-001/deepfake-detection-using-ViT')
-    model = AutoModelForImageClassification.from_pretrained('ashish-001/deepfake-detection-using-ViT')
+    model = AutoModelForImageClassification.from_pretrained('ashish-001/deepfake-detection-using-ViT').to(device).eval()
     return image_processor, model
 
 def predict_single_image(image_path, image_processor, model):
     try:
         image = Image.open(image_path)
         inputs = image_processor(images=image, return_tensors="pt")
-        with torch.no_grad():
+        inputs = {k: v.to(device, non_blocking=True) for k, v in inputs.items()}
+        with torch.inference_mode():
             outputs = model(**inputs)
             logits = outputs.logits
             pred = torch.argmax(logits, dim=1).item()
@@ -71,23 +74,38 @@ def save_results(results, output_file='deepfake_results.txt'):
     
     print(f"Results saved to {output_file}")
 
-image_processor, model = load_model()
-image_folder = "./self_test_images/Fake"
+# Model loaded by init_worker() in each inference worker process
+_worker_model = None
+
+def init_worker(num_threads=None):
+    """Process pool initializer: cap torch's intra-op threads and load the model once so the worker is warm"""
+    global _worker_model
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    _worker_model = load_model()
+
+def predict_file(image_path):
+    """Predict a single image with the model loaded by init_worker()"""
+    image_processor, model = _worker_model
+    return predict_single_image(image_path, image_processor, model)
 
-if os.path.exists(image_folder):
-    print(f"\nTesting images from folder: {image_folder}")
-    results = predict_batch_images(image_folder, image_processor, model)
+if __name__ == "__main__":
+    image_processor, model = load_model()
+    image_folder = "./self_test_images/Fake"
+
+    if os.path.exists(image_folder):
+        print(f"\nTesting images from folder: {image_folder}")
+        results = predict_batch_images(image_folder, image_processor, model)
     
-    # Print summary
-    if results:
-        real_count = sum(1 for r in results if r['prediction'] == 'Real')
-        fake_count = sum(1 for r in results if r['prediction'] == 'Fake')
+        # Print summary
+        if results:
+            real_count = sum(1 for r in results if r['prediction'] == 'Real')
+            fake_count = sum(1 for r in results if r['prediction'] == 'Fake')
         
-        print(f"\nSummary:")
-        print(f"Total images processed: {len(results)}")
-        print(f"Real images: {real_count}")
-        print(f"Fake images: {fake_count}")
+            print(f"\nSummary:")
+            print(f"Total images processed: {len(results)}")
+            print(f"Real images: {real_count}")
+            print(f"Fake images: {fake_count}")
         
-        # Save results
-        save_results(results)
-
+            # Save results
+            save_results(results)
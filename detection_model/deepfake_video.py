@@ -1,10 +1,11 @@
 import torch
 import numpy as np
 from transformers import VideoMAEImageProcessor, VideoMAEForVideoClassification
+import torch.nn.functional as F
 import cv2
-from torchvision import transforms
 import os
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 import json
 
 
@@ -25,8 +26,9 @@ class DeepfakeDetector:
         
         # Get model configuration
         self.num_frames = self.model.config.num_frames
-        self.image_mean = torch.tensor(self.image_processor.image_mean)
-        self.image_std = torch.tensor(self.image_processor.image_std)
+        # Shaped (1, channels, 1, 1) so they broadcast over a stack of frames
+        self.image_mean = torch.tensor(self.image_processor.image_mean, device=self.device).view(1, -1, 1, 1)
+        self.image_std = torch.tensor(self.image_processor.image_std, device=self.device).view(1, -1, 1, 1)
         
         # Get image size
         if "shortest_edge" in self.image_processor.size:
@@ -55,99 +57,140 @@ class DeepfakeDetector:
         
         return [frames[i] for i in indices]
 
-    def preprocess_video(self, video_path):
+    def load_video_frames(self, video_path):
         """
-        Preprocess video for the model without PyTorchVideo dependency
+        Decode a video and uniformly sample frames as a uint8 (num_frames, H, W, 3) CPU tensor.
+        Frames are sampled while decoding, so only the sampled frames are ever held in memory.
         """
-        # Read video
         cap = cv2.VideoCapture(video_path)
-        frames = []
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if total_frames <= 0:
+            # No frame count in the container: count frames without keeping them, then rewind
+            while cap.grab():
+                total_frames += 1
+            cap.release()
+            cap = cv2.VideoCapture(video_path)
+        
+        if total_frames <= 0:
+            cap.release()
+            raise ValueError(f"Could not read any frames from {video_path}")
+        
+        print(f"Total frames in video: {total_frames}")
         
-        while True:
-            ret, frame = cap.read()
-            if not ret:
+        # Uniformly sample the required number of frame indices
+        indices = self.uniform_temporal_subsample(range(total_frames), self.num_frames)
+        wanted = set(indices)
+        
+        # grab() advances without converting a frame; only sampled frames are retrieved
+        frames = {}
+        for i in range(max(indices) + 1):
+            if not cap.grab():
                 break
-            # Convert BGR to RGB
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            frames.append(frame)
+            if i in wanted:
+                ret, frame = cap.retrieve()
+                if ret:
+                    # Convert BGR to RGB
+                    frames[i] = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
         
         cap.release()
         
-        if len(frames) == 0:
+        if not frames:
             raise ValueError(f"Could not read any frames from {video_path}")
         
-        print(f"Total frames in video: {len(frames)}")
+        # Container frame counts can overshoot; reuse the closest earlier decoded frame for missing indices
+        sampled_frames, previous = [], None
+        for i in indices:
+            previous = frames.get(i, previous)
+            sampled_frames.append(previous)
+        first = next(frame for frame in sampled_frames if frame is not None)
+        sampled_frames = [first if frame is None else frame for frame in sampled_frames]
         
-        # Uniformly sample the required number of frames
-        sampled_frames = self.uniform_temporal_subsample(frames, self.num_frames)
+        frames_tensor = torch.from_numpy(np.stack(sampled_frames))
+        if self.device.type == "cuda":
+            # Page-locked memory lets the host-to-device copy run asynchronously
+            frames_tensor = frames_tensor.pin_memory()
         
-        # Convert to tensor and preprocess
-        processed_frames = []
+        return frames_tensor
+
+    def preprocess_frames(self, frames_tensor):
+        """
+        Resize and normalize sampled frames as a single batch on the model device
+        """
+        video_tensor = frames_tensor.to(self.device, non_blocking=True)
         
-        # Define transforms
-        resize_transform = transforms.Resize((self.height, self.width))
+        # (num_frames, height, width, channels) -> (num_frames, channels, height, width) in [0, 1]
+        video_tensor = video_tensor.permute(0, 3, 1, 2).float().div_(255.0)
         
-        for frame in sampled_frames:
-            # Convert to tensor and normalize to [0, 1]
-            frame_tensor = torch.from_numpy(frame).float() / 255.0
-            
-            # Rearrange from HWC to CHW
-            frame_tensor = frame_tensor.permute(2, 0, 1)
-            
-            # Resize
-            frame_tensor = resize_transform(frame_tensor)
-            
-            # Normalize with model's expected mean and std
-            frame_tensor = transforms.functional.normalize(
-                frame_tensor, 
-                self.image_mean.tolist(), 
-                self.image_std.tolist()
-            )
-            
-            processed_frames.append(frame_tensor)
+        # Resize
+        video_tensor = F.interpolate(
+            video_tensor,
+            size=(self.height, self.width),
+            mode="bilinear",
+            align_corners=False,
+            antialias=True
+        )
         
-        # Stack frames: (num_frames, channels, height, width)
-        video_tensor = torch.stack(processed_frames)
+        # Normalize with model's expected mean and std
+        video_tensor = (video_tensor - self.image_mean) / self.image_std
         
         return video_tensor.unsqueeze(0)  # Add batch dimension
 
-    def predict_single_video(self, video_path):
+    def preprocess_video(self, video_path):
+        """
+        Preprocess video for the model without PyTorchVideo dependency
+        """
+        return self.preprocess_frames(self.load_video_frames(video_path))
+
+    def format_prediction(self, video_path, logits):
+        """
+        Build the result dict for one video from its (num_classes,) logits
+        """
+        probabilities = torch.nn.functional.softmax(logits, dim=-1)
+        
+        # Get prediction
+        predicted_class_idx = logits.argmax(-1).item()
+        confidence = probabilities.max().item()
+        
+        # Get all class probabilities
+        all_probs = probabilities.cpu().numpy().flatten()
+        
+        # Map to labels - check model config for actual labels
+        if hasattr(self.model.config, 'id2label') and self.model.config.id2label:
+            label = self.model.config.id2label[predicted_class_idx]
+        else:
+            # Fallback assumption: 0=real, 1=fake
+            label = "FAKE" if predicted_class_idx == 1 else "REAL"
+        
+        return {
+            "video_path": video_path,
+            "prediction": label,
+            "confidence": confidence,
+            "predicted_class_idx": predicted_class_idx,
+            "all_probabilities": all_probs.tolist(),
+            "raw_logits": logits.cpu().numpy().flatten().tolist()
+        }
+
+    def predict_frames(self, video_paths, frames_tensors):
+        """
+        Predict several already decoded videos with a single batched forward pass
+        """
+        pixel_values = torch.cat([self.preprocess_frames(frames) for frames in frames_tensors])
+        
+        # Run inference
+        with torch.inference_mode():
+            logits = self.model(pixel_values=pixel_values).logits
+        
+        return [self.format_prediction(path, row) for path, row in zip(video_paths, logits)]
+
+    def predict_single_video(self, video_path, frames_tensor=None):
         """
-        Predict if a single video is deepfake or real
+        Predict if a single video is deepfake or real, optionally from already decoded frames
         """
         try:
             # Preprocess video
-            pixel_values = self.preprocess_video(video_path)
-            pixel_values = pixel_values.to(self.device)
-            
-            # Run inference
-            with torch.no_grad():
-                outputs = self.model(pixel_values=pixel_values)
-                logits = outputs.logits
-                probabilities = torch.nn.functional.softmax(logits, dim=-1)
-            
-            # Get prediction
-            predicted_class_idx = logits.argmax(-1).item()
-            confidence = probabilities.max().item()
-            
-            # Get all class probabilities
-            all_probs = probabilities.cpu().numpy().flatten()
-            
-            # Map to labels - check model config for actual labels
-            if hasattr(self.model.config, 'id2label') and self.model.config.id2label:
-                label = self.model.config.id2label[predicted_class_idx]
-            else:
-                # Fallback assumption: 0=real, 1=fake
-                label = "FAKE" if predicted_class_idx == 1 else "REAL"
-            
-            return {
-                "video_path": video_path,
-                "prediction": label,
-                "confidence": confidence,
-                "predicted_class_idx": predicted_class_idx,
-                "all_probabilities": all_probs.tolist(),
-                "raw_logits": logits.cpu().numpy().flatten().tolist()
-            }
+            if frames_tensor is None:
+                frames_tensor = self.load_video_frames(video_path)
+            return self.predict_frames([video_path], [frames_tensor])[0]
             
         except Exception as e:
             return {
@@ -155,20 +198,57 @@ class DeepfakeDetector:
                 "error": str(e)
             }
 
-    def predict_batch(self, video_paths):
+    def predict_batch(self, video_paths, batch_size=4, num_workers=4):
         """
-        Predict multiple videos
+        Predict multiple videos, decoding them on worker threads and running the model
+        on batches of batch_size videos at a time
         """
         results = []
-        for i, video_path in enumerate(video_paths):
-            print(f"Processing video {i+1}/{len(video_paths)}: {os.path.basename(video_path)}")
-            result = self.predict_single_video(video_path)
-            results.append(result)
+        chunks = [video_paths[i:i + batch_size] for i in range(0, len(video_paths), batch_size)]
+        if not chunks:
+            return results
+        
+        # Decode videos in parallel (cv2 releases the GIL), prefetching the next chunk
+        # while the current one runs inference on the main thread
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            def submit(chunk):
+                return [executor.submit(self.load_video_frames, path) for path in chunk]
             
-            if "error" not in result:
-                print(f"  -> {result['prediction']} (confidence: {result['confidence']:.3f})")
-            else:
-                print(f"  -> ERROR: {result['error']}")
+            next_futures = submit(chunks[0])
+            for c, chunk in enumerate(chunks):
+                futures = next_futures
+                if c + 1 < len(chunks):
+                    next_futures = submit(chunks[c + 1])
+                
+                chunk_results = [None] * len(chunk)
+                decoded = []
+                for j, (video_path, future) in enumerate(zip(chunk, futures)):
+                    try:
+                        decoded.append((j, future.result()))
+                    except Exception as e:
+                        chunk_results[j] = {
+                            "video_path": video_path,
+                            "error": str(e)
+                        }
+                
+                if decoded:
+                    indices = [j for j, _ in decoded]
+                    try:
+                        predictions = self.predict_frames([chunk[j] for j in indices], [frames for _, frames in decoded])
+                    except Exception as e:
+                        predictions = [{"video_path": chunk[j], "error": str(e)} for j in indices]
+                    for j, result in zip(indices, predictions):
+                        chunk_results[j] = result
+                
+                for j, result in enumerate(chunk_results):
+                    i = c * batch_size + j
+                    print(f"Processed video {i+1}/{len(video_paths)}: {os.path.basename(chunk[j])}")
+                    results.append(result)
+                    
+                    if "error" not in result:
+                        print(f"  -> {result['prediction']} (confidence: {result['confidence']:.3f})")
+                    else:
+                        print(f"  -> ERROR: {result['error']}")
         
         return results
 
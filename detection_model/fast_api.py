@@ -1,29 +1,37 @@
 from fastapi import FastAPI, HTTPException, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware
 from pydantic import BaseModel
 import os
-from datetime import datetime
+from datetime import datetime, timezone
 import uuid
 from supabase import create_client, Client
 import jwt
 from typing import Optional
 import asyncio
 import tempfile
-from deepfake_image import load_model, predict_single_image, predict_batch_images
+import hashlib
+import logging
+import base64
+import orjson
+import threading
+import time
+from cachetools import TTLCache
+import httpx
+from storage3.utils import StorageException
+from postgrest.exceptions import APIError
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+from deepfake_image import init_worker, predict_file
+from ulid import ULID
 
-image_processor, model = load_model()
+logger = logging.getLogger(__name__)
 
 # Initialize FastAPI app
-app = FastAPI(title="File Analysis API", version="1.0.0")
-
-# Add CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # Configure this properly for production
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+app = FastAPI(title="File Analysis API", version="1.0.0", default_response_class=ORJSONResponse)
 
 # Configuration - Set these as environment variables
 SUPABASE_URL = os.getenv("SUPABASE_URL")
@@ -31,11 +39,113 @@ SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")  # Service role key for storage operations
 JWT_SECRET = os.getenv("JWT_SECRET", "your-secret-key")
 STORAGE_BUCKET = os.getenv("STORAGE_BUCKET", "uploads")  # Supabase storage bucket name
+JWT_CACHE_TTL = float(os.getenv("JWT_CACHE_TTL", "30"))  # Seconds a verified token is trusted without re-decoding
+JWT_CACHE_MAX = int(os.getenv("JWT_CACHE_MAX", "10000"))
+
+# Columns and row cap for /detections/{user_id}
+DETECTION_LIST_COLUMNS = "id,created_at,confidence,analysis_result,file_path,status"
+DETECTION_LIST_LIMIT = 200
+
+# Pre-built jwt.decode arguments so the auth hot path doesn't re-encode the key or rebuild them per call
+_JWT_KEY = JWT_SECRET.encode("utf-8")
+_JWT_ALGS = ("HS256",)
+_JWT_OPTS = {"require": ["exp"]}
+_JWT_MAX_LENGTH = 4096
 
 # Initialize Supabase client
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 # Service client for storage operations (has elevated permissions)
 supabase_service: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+# Raw Storage REST client, used where the SDK would need the whole file in memory.
+# One pooled HTTP/2 transport is shared by every handler so connections and TLS sessions are reused.
+storage_http = httpx.AsyncClient(
+    base_url=f"{SUPABASE_URL}/storage/v1",
+    headers={"apikey": SUPABASE_SERVICE_KEY or "", "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}"},
+    timeout=httpx.Timeout(30.0, connect=2.0),
+    transport=httpx.AsyncHTTPTransport(
+        http2=True,
+        retries=2,  # Retries failed connection attempts only
+        limits=httpx.Limits(
+            max_connections=int(os.getenv("SUPA_MAX_CONN", "50")),
+            max_keepalive_connections=int(os.getenv("SUPA_MAX_KEEPALIVE", "25")),
+            keepalive_expiry=30.0
+        )
+    )
+)
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB
+# Requests to the upload endpoints larger than this are rejected with 413
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(100 << 20)))  # 100 MiB
+UPLOAD_PATHS = ("/upload-file", "/upload-and-analyze")
+
+class UploadSizeLimitMiddleware:
+    """
+    Pure ASGI middleware capping request bodies on UPLOAD_PATHS at MAX_UPLOAD_BYTES: rejects on
+    Content-Length before any body is read, and counts received bytes for bodies without one
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in UPLOAD_PATHS:
+            await self.app(scope, receive, send)
+            return
+        
+        content_length = Headers(scope=scope).get("content-length", "")
+        if content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES:
+            await ORJSONResponse(status_code=413, content={"detail": "File too large"})(scope, receive, send)
+            return
+        
+        received = 0
+        
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > MAX_UPLOAD_BYTES:
+                    # Raised while FastAPI parses the form, so the upload is never fully spooled
+                    raise HTTPException(status_code=413, detail="File too large")
+            return message
+        
+        await self.app(scope, limited_receive, send)
+
+app.add_middleware(UploadSizeLimitMiddleware)
+
+# Compress large JSON responses (e.g. /detections); Brotli when available, which falls back to gzip itself
+try:
+    from brotli_asgi import BrotliMiddleware
+    app.add_middleware(BrotliMiddleware, quality=4, minimum_size=1024)
+except ImportError:
+    app.add_middleware(GZipMiddleware, minimum_size=1024)
+
+# Add CORS middleware last: Starlette runs later-added middleware outermost, so CORS headers
+# are also applied to responses returned early by the middleware above (e.g. 413s)
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],  # Configure this properly for production
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+# Bound in-flight uploads (memory, Supabase rate limits) and model runs (CPU/GPU) independently
+_upload_sem = asyncio.Semaphore(int(os.getenv("MAX_CONCURRENT_UPLOADS", "16")))
+MAX_CONCURRENT_ANALYSES = int(os.getenv("MAX_CONCURRENT_ANALYSES", "4"))
+_analysis_sem = asyncio.Semaphore(MAX_CONCURRENT_ANALYSES)
+# At most MAX_CONCURRENT_ANALYSES predictions run at once, so more workers would only sit idle
+INFER_WORKERS = int(os.getenv("INFER_WORKERS", str(MAX_CONCURRENT_ANALYSES)))
+
+# Storage paths recently found missing, so retries with a bogus path skip the download round-trip
+_missing_files: TTLCache = TTLCache(maxsize=1024, ttl=5)
+
+# Detection records are queued by the handlers and bulk-inserted by a background task
+DETECTION_BATCH_SIZE = 500
+DETECTION_FLUSH_INTERVAL = 0.05  # Seconds to wait for more records before inserting a batch
+DETECTION_INSERT_RETRIES = 3
+DETECTION_RETRY_BACKOFF = 0.5  # Seconds before the first retry, doubled for each further one
+_detections_queue: "asyncio.Queue[Optional[dict]]" = asyncio.Queue()
+_detections_writer: Optional[asyncio.Task] = None
 
 # Pydantic models
 class UploadUrlRequest(BaseModel):
@@ -61,43 +171,283 @@ class AnalysisResponse(BaseModel):
     detection_result: DetectionResult
     message: str
 
+def _ext(name: str) -> str:
+    """File extension without the leading dot ('' if there is none)"""
+    return os.path.splitext(name)[1][1:]
+
+# Verified JWT payloads keyed by a digest of the token; invalid tokens are never cached
+_TOKEN_CACHE: TTLCache = TTLCache(maxsize=JWT_CACHE_MAX, ttl=JWT_CACHE_TTL)
+_TOKEN_CACHE_LOCK = threading.Lock()
+
 # JWT token verification
+def _is_well_formed_jwt(token: str) -> bool:
+    """Cheap structural check (three segments, HS256 header) to reject garbage before HMAC verification"""
+    if len(token) >= _JWT_MAX_LENGTH or token.count(".") != 2:
+        return False
+    header = token.partition(".")[0]
+    try:
+        return orjson.loads(base64.urlsafe_b64decode(header + "=" * (-len(header) % 4))).get("alg") == "HS256"
+    except (ValueError, AttributeError):
+        return False
+
 def verify_token(token: str) -> dict:
     """Verify JWT token and return user data"""
-    try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
+    key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    with _TOKEN_CACHE_LOCK:
+        payload = _TOKEN_CACHE.get(key)
+    # A cached payload is only trusted until the token's own expiry
+    if payload is not None and payload.get("exp", float("inf")) > time.time():
         return payload
+
+    if not _is_well_formed_jwt(token):
+        raise HTTPException(status_code=401, detail="Invalid token")
+    try:
+        payload = jwt.decode(token, _JWT_KEY, algorithms=_JWT_ALGS, options=_JWT_OPTS)
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token has expired")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+    with _TOKEN_CACHE_LOCK:
+        _TOKEN_CACHE[key] = payload
+    return payload
+
+async def _iter_upload(file: UploadFile):
+    """Yield the upload body in chunks (Starlette has already spooled it to a temp file)"""
+    await file.seek(0)
+    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+        yield chunk
+
+async def upload_to_storage(file_path: str, file: UploadFile):
+    """Stream an uploaded file into Supabase Storage without reading it into memory"""
+    async with _upload_sem:
+        response = await storage_http.post(
+            f"/object/{STORAGE_BUCKET}/{file_path}",
+            content=_iter_upload(file),
+            headers={
+                "content-type": file.content_type or "application/octet-stream",
+                "x-upsert": "true"
+            }
+        )
+    if response.is_error:
+        raise HTTPException(status_code=500, detail=f"Upload failed: {response.text}")
+    _missing_files.pop(file_path, None)
+
+def _is_not_found(error: StorageException) -> bool:
+    details = error.args[0] if error.args and isinstance(error.args[0], dict) else {}
+    return str(details.get("statusCode")) == "404" or details.get("error") in ("not_found", "Not found")
+
 async def run_analysis_model(file_path: str) -> dict:
-    # Download the file from Supabase Storage temporarily
-    download_response = supabase_service.storage.from_(STORAGE_BUCKET).download(file_path)
-    if hasattr(download_response, 'error') and download_response.error:
-        raise Exception(f"Download failed: {download_response.error}")
+    async with _analysis_sem:
+        # Download the file from Supabase Storage temporarily
+        if file_path in _missing_files:
+            raise HTTPException(status_code=404, detail="File not found in storage")
+        try:
+            download_response = await asyncio.to_thread(supabase_service.storage.from_(STORAGE_BUCKET).download, file_path)
+        except StorageException as e:
+            if _is_not_found(e):
+                _missing_files[file_path] = True
+                raise HTTPException(status_code=404, detail="File not found in storage")
+            raise
+        if hasattr(download_response, 'error') and download_response.error:
+            raise Exception(f"Download failed: {download_response.error}")
+
+        # Save to a temporary local file
+        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file_path)[-1]) as tmp_file:
+            tmp_file.write(download_response)
+            tmp_file_path = tmp_file.name
+
+        # Run prediction in the inference process pool so the event loop stays free
+        pool = app.state.inference_pool
+        try:
+            label, confidence = await asyncio.get_running_loop().run_in_executor(pool, predict_file, tmp_file_path)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM), which breaks the whole pool; replace it so later requests recover
+            _replace_inference_pool(pool)
+            raise HTTPException(status_code=503, detail="Inference worker crashed, please retry")
+        finally:
+            os.remove(tmp_file_path)
+
+        if label is None:
+            raise Exception("Prediction failed")
 
-    # Save to a temporary local file
-    with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file_path)[-1]) as tmp_file:
-        tmp_file.write(download_response)
-        tmp_file_path = tmp_file.name
+        return {
+            "result": {
+                "label": label
+            },
+            "confidence": confidence
+        }
+
+def _api_error_code(error: APIError) -> str:
+    # A PostgREST/SQLSTATE code (e.g. "PGRST000", "23505"), or the HTTP status for non-JSON (gateway) responses
+    return str(error.code or "")
+
+def _is_transient(error: Exception) -> bool:
+    """Whether an insert failure is worth retrying: network, gateway, connection or capacity trouble"""
+    if not isinstance(error, APIError):
+        return True
+    code = _api_error_code(error)
+    if len(code) == 3 and code.isdigit():
+        return int(code) >= 500
+    # PGRST0xx: PostgREST can't reach Postgres; 08/53/57: connection, resources, shutdown; 40xxx: retryable conflicts
+    return code.startswith(("PGRST0", "08", "53", "57", "40001", "40P01"))
+
+def _is_data_error(error: Exception) -> bool:
+    """Whether PostgREST rejected the rows themselves (4xx, data exceptions, constraint violations)"""
+    if not isinstance(error, APIError):
+        return False
+    code = _api_error_code(error)
+    if len(code) == 3 and code.isdigit():
+        return 400 <= int(code) < 500
+    return code.startswith(("22", "23"))
+
+async def _insert_with_retry(records: list) -> Optional[Exception]:
+    """Insert records in one PostgREST call, retrying transient failures with backoff; returns the last error"""
+    for attempt in range(DETECTION_INSERT_RETRIES):
+        try:
+            await asyncio.to_thread(supabase.table("detections").insert(records).execute)
+            return None
+        except Exception as e:
+            error = e
+            if not _is_transient(e):
+                # PostgREST rejected the request itself; retrying the same rows won't help
+                return e
+            if attempt + 1 < DETECTION_INSERT_RETRIES:
+                await asyncio.sleep(DETECTION_RETRY_BACKOFF * 2 ** attempt)
+    return error
 
-    # Run prediction
-    label, confidence = predict_batch_images(tmp_file_path, image_processor, model)
+def _log_dropped(record: dict, error: Exception):
+    # Log the full record so it can be replayed by hand
+    logger.error("Dropped detection record %s: %s", orjson.dumps(record).decode(), error)
 
-    # Optionally delete temp file
-    os.remove(tmp_file_path)
+async def _insert_detections(batch: list):
+    """Insert a batch of detection records, falling back to per-row inserts so one bad record can't drop the rest"""
+    error = await _insert_with_retry(batch)
+    if error is None:
+        return
+    
+    if not _is_data_error(error) or len(batch) == 1:
+        # Outage outlasting the retries, or a failure every row would hit: row-by-row inserts can't help
+        for record in batch:
+            _log_dropped(record, error)
+        return
+    
+    logger.warning("Bulk insert of %d detection records was rejected (%s); retrying row by row", len(batch), error)
+    for record in batch:
+        error = await _insert_with_retry([record])
+        if error is not None:
+            _log_dropped(record, error)
 
-    if label is None:
-        raise Exception("Prediction failed")
+async def _detections_writer_loop():
+    """Bulk-insert queued records until stop_detections_writer queues the None sentinel"""
+    loop = asyncio.get_running_loop()
+    stopping = False
+    while not stopping:
+        record = await _detections_queue.get()
+        if record is None:
+            break
+        batch = [record]
+        deadline = loop.time() + DETECTION_FLUSH_INTERVAL
+        try:
+            while len(batch) < DETECTION_BATCH_SIZE:
+                record = await asyncio.wait_for(_detections_queue.get(), deadline - loop.time())
+                if record is None:
+                    stopping = True
+                    break
+                batch.append(record)
+        except asyncio.TimeoutError:
+            pass
+        await _insert_detections(batch)
 
-    return {
-        "result": {
-            "label": label
+async def _finalize_detection(user_id: str, file_path: str, analysis_result: dict, message: str) -> ORJSONResponse:
+    """Queue the detection's database record and build the AnalysisResponse-shaped API response"""
+    # Time-ordered id (ULID as a uuid) so inserts land at the tail of the primary-key index
+    detection_id = str(ULID().to_uuid())
+    ts_iso = datetime.now(timezone.utc).isoformat()
+    
+    # Queue result for the batched Supabase writer
+    await _detections_queue.put({
+        "id": detection_id,
+        "user_id": user_id,
+        "file_path": file_path,
+        "storage_bucket": STORAGE_BUCKET,
+        "analysis_result": analysis_result["result"],
+        "confidence": analysis_result["confidence"],
+        "created_at": ts_iso,
+        "status": "completed"
+    })
+    
+    # Every field is produced server-side, so serialize the dict directly instead of
+    # validating and encoding an AnalysisResponse model
+    return ORJSONResponse({
+        "success": True,
+        "detection_result": {
+            "detection_id": detection_id,
+            "result": analysis_result["result"],
+            "confidence": analysis_result["confidence"],
+            "timestamp": ts_iso
         },
-        "confidence": confidence
-    }
+        "message": message
+    })
+
+def _create_inference_pool() -> ProcessPoolExecutor:
+    # Spawned (not forked) workers each load the model once in init_worker and split the CPU cores between them
+    return ProcessPoolExecutor(
+        max_workers=INFER_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+        initargs=(max(1, (os.cpu_count() or 1) // INFER_WORKERS),)
+    )
+
+async def _warm_inference_pool(pool: ProcessPoolExecutor):
+    """Start every worker and wait for its model to load by giving each a trivial task"""
+    loop = asyncio.get_running_loop()
+    # Workers are spawned on demand, one per submitted task while none is idle
+    await asyncio.gather(*(loop.run_in_executor(pool, os.getpid) for _ in range(INFER_WORKERS)))
+
+def _replace_inference_pool(broken: ProcessPoolExecutor):
+    # Concurrent requests can all see the same broken pool; only the first replaces it
+    if app.state.inference_pool is not broken:
+        return
+    logger.error("Inference process pool is broken; starting a new one")
+    broken.shutdown(wait=False, cancel_futures=True)
+    app.state.inference_pool = _create_inference_pool()
+    # Keep a reference so the warm-up task isn't garbage collected mid-flight
+    app.state.inference_pool_warmup = asyncio.create_task(_warm_inference_pool(app.state.inference_pool))
+
+@app.on_event("startup")
+async def start_inference_pool():
+    app.state.inference_pool = _create_inference_pool()
+    await _warm_inference_pool(app.state.inference_pool)
+
+@app.on_event("shutdown")
+async def stop_inference_pool():
+    app.state.inference_pool.shutdown(cancel_futures=True)
+
+@app.on_event("startup")
+async def start_detections_writer():
+    global _detections_writer
+    _detections_writer = asyncio.create_task(_detections_writer_loop())
+
+@app.on_event("shutdown")
+async def close_storage_http():
+    await storage_http.aclose()
+
+@app.on_event("shutdown")
+async def stop_detections_writer():
+    """Stop the background writer and insert anything still queued"""
+    if _detections_writer is not None:
+        # The sentinel is queued behind every pending record, and the writer finishes its
+        # in-flight insert (retries included) before it sees it, so nothing is cut off
+        await _detections_queue.put(None)
+        await _detections_writer
+    
+    # Records queued after the sentinel
+    pending = []
+    while not _detections_queue.empty():
+        pending.append(_detections_queue.get_nowait())
+    for i in range(0, len(pending), DETECTION_BATCH_SIZE):
+        await _insert_detections(pending[i:i + DETECTION_BATCH_SIZE])
 
 @app.get("/")
 async def root():
@@ -108,8 +458,7 @@ async def generate_upload_url(request: UploadUrlRequest):
     """Generate a signed URL for Supabase Storage upload"""
     try:
         # Generate unique file path
-        file_extension = request.filename.split('.')[-1] if '.' in request.filename else ''
-        file_path = f"uploads/{uuid.uuid4()}.{file_extension}"
+        file_path = f"uploads/{uuid.uuid4().hex}.{_ext(request.filename)}"
         
         # Create signed upload URL for Supabase Storage
         # Note: Supabase doesn't have pre-signed URLs like S3, so we'll use a different approach
@@ -140,21 +489,8 @@ async def upload_file(
         if not user_id:
             raise HTTPException(status_code=401, detail="Invalid user token")
         
-        # Read file content
-        file_content = await file.read()
-        
         # Upload to Supabase Storage
-        result = supabase_service.storage.from_(STORAGE_BUCKET).upload(
-            path=file_path,
-            file=file_content,
-            file_options={
-                "content-type": file.content_type,
-                "upsert": True
-            }
-        )
-        
-        if hasattr(result, 'error') and result.error:
-            raise HTTPException(status_code=500, detail=f"Upload failed: {result.error}")
+        await upload_to_storage(file_path, file)
         
         return {
             "success": True,
@@ -167,7 +503,7 @@ async def upload_file(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error uploading file: {str(e)}")
 
-@app.post("/upload-complete", response_model=AnalysisResponse)
+@app.post("/upload-complete", responses={200: {"model": AnalysisResponse}})
 async def upload_complete(request: UploadCompleteRequest):
     """Process uploaded file and run analysis"""
     try:
@@ -178,55 +514,17 @@ async def upload_complete(request: UploadCompleteRequest):
         if not user_id:
             raise HTTPException(status_code=401, detail="Invalid user token")
         
-        # Verify file exists in Supabase Storage
-        try:
-            file_info = supabase_service.storage.from_(STORAGE_BUCKET).info(request.file_path)
-            if hasattr(file_info, 'error') and file_info.error:
-                raise HTTPException(status_code=404, detail="File not found in storage")
-        except Exception:
-            raise HTTPException(status_code=404, detail="File not found in storage")
-        
-        # Run analysis model
+        # Run analysis model (responds 404 if the file isn't in Supabase Storage)
         analysis_result = await run_analysis_model(request.file_path)
         
-        # Create detection result
-        detection_id = str(uuid.uuid4())
-        detection_result = DetectionResult(
-            detection_id=detection_id,
-            result=analysis_result["result"],
-            confidence=analysis_result["confidence"],
-            timestamp=datetime.utcnow()
-        )
-        
-        # Store result in Supabase database
-        detection_record = {
-            "id": detection_id,
-            "user_id": user_id,
-            "file_path": request.file_path,
-            "storage_bucket": STORAGE_BUCKET,
-            "analysis_result": analysis_result["result"],
-            "confidence": analysis_result["confidence"],
-            "created_at": detection_result.timestamp.isoformat(),
-            "status": "completed"
-        }
-        
-        result = supabase.table("detections").insert(detection_record).execute()
-        
-        if not result.data:
-            raise HTTPException(status_code=500, detail="Failed to save detection record")
-        
-        return AnalysisResponse(
-            success=True,
-            detection_result=detection_result,
-            message="Analysis completed successfully"
-        )
+        return await _finalize_detection(user_id, request.file_path, analysis_result, "Analysis completed successfully")
         
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing upload: {str(e)}")
 
-@app.post("/upload-and-analyze")
+@app.post("/upload-and-analyze", responses={200: {"model": AnalysisResponse}})
 async def upload_and_analyze(
     file: UploadFile = File(...),
     user_token: str = Form(...)
@@ -241,59 +539,15 @@ async def upload_and_analyze(
             raise HTTPException(status_code=401, detail="Invalid user token")
         
         # Generate unique file path
-        file_extension = file.filename.split('.')[-1] if '.' in file.filename else ''
-        file_path = f"uploads/{uuid.uuid4()}.{file_extension}"
-        
-        # Read file content
-        file_content = await file.read()
+        file_path = f"uploads/{uuid.uuid4().hex}.{_ext(file.filename)}"
         
         # Upload to Supabase Storage
-        upload_result = supabase_service.storage.from_(STORAGE_BUCKET).upload(
-            path=file_path,
-            file=file_content,
-            file_options={
-                "content-type": file.content_type,
-                "upsert": True
-            }
-        )
-        
-        if hasattr(upload_result, 'error') and upload_result.error:
-            raise HTTPException(status_code=500, detail=f"Upload failed: {upload_result.error}")
+        await upload_to_storage(file_path, file)
         
         # Run analysis model
         analysis_result = await run_analysis_model(file_path)
         
-        # Create detection result
-        detection_id = str(uuid.uuid4())
-        detection_result = DetectionResult(
-            detection_id=detection_id,
-            result=analysis_result["result"],
-            confidence=analysis_result["confidence"],
-            timestamp=datetime.utcnow()
-        )
-        
-        # Store result in Supabase database
-        detection_record = {
-            "id": detection_id,
-            "user_id": user_id,
-            "file_path": file_path,
-            "storage_bucket": STORAGE_BUCKET,
-            "analysis_result": analysis_result["result"],
-            "confidence": analysis_result["confidence"],
-            "created_at": detection_result.timestamp.isoformat(),
-            "status": "completed"
-        }
-        
-        result = supabase.table("detections").insert(detection_record).execute()
-        
-        if not result.data:
-            raise HTTPException(status_code=500, detail="Failed to save detection record")
-        
-        return AnalysisResponse(
-            success=True,
-            detection_result=detection_result,
-            message="Upload and analysis completed successfully"
-        )
+        return await _finalize_detection(user_id, file_path, analysis_result, "Upload and analysis completed successfully")
         
     except HTTPException:
         raise
@@ -310,7 +564,15 @@ async def get_user_detections(user_id: str, token: str):
             raise HTTPException(status_code=403, detail="Access denied")
         
         # Fetch detections from Supabase
-        result = supabase.table("detections").select("*").eq("user_id", user_id).execute()
+        # Served by the (user_id, created_at desc) index; only the columns the listing needs
+        result = await asyncio.to_thread(
+            supabase.table("detections")
+            .select(DETECTION_LIST_COLUMNS)
+            .eq("user_id", user_id)
+            .order("created_at", desc=True)
+            .limit(DETECTION_LIST_LIMIT)
+            .execute
+        )
         
         return {
             "success": True,
@@ -331,7 +593,7 @@ async def get_detection_details(detection_id: str, token: str):
         user_id = user_data.get("user_id")
         
         # Fetch detection from Supabase
-        result = supabase.table("detections").select("*").eq("id", detection_id).execute()
+        result = await asyncio.to_thread(supabase.table("detections").select("*").eq("id", detection_id).execute)
         
         if not result.data:
             raise HTTPException(status_code=404, detail="Detection not found")
@@ -361,13 +623,16 @@ async def get_file_url(file_path: str, token: str):
         user_id = user_data.get("user_id")
         
         # Verify user has access to this file (check if they own a detection with this file)
-        result = supabase.table("detections").select("*").eq("user_id", user_id).eq("file_path", file_path).execute()
+        result = await asyncio.to_thread(
+            supabase.table("detections").select("id").eq("user_id", user_id).eq("file_path", file_path).limit(1).execute
+        )
         
         if not result.data:
             raise HTTPException(status_code=403, detail="Access denied to this file")
         
         # Create signed URL for file access
-        signed_url = supabase_service.storage.from_(STORAGE_BUCKET).create_signed_url(
+        signed_url = await asyncio.to_thread(
+            supabase_service.storage.from_(STORAGE_BUCKET).create_signed_url,
             path=file_path,
             expires_in=3600  # 1 hour
         )
@@ -385,31 +650,39 @@ async def get_file_url(file_path: str, token: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting file URL: {str(e)}")
 
+# Last healthy /health response, reused for HEALTH_CACHE_TTL seconds so frequent probes don't load Supabase
+HEALTH_CACHE_TTL = float(os.getenv("HEALTH_CACHE_TTL", "5"))
+_health_cache = {"ts": 0.0, "value": None}
+
 # Health check endpoint
 @app.get("/health")
 async def health_check():
-    try:
-        # Test Supabase connection
-        supabase.table("detections").select("id").limit(1).execute()
-        supabase_status = "connected"
-    except:
-        supabase_status = "disconnected"
+    if _health_cache["value"] is not None and time.monotonic() - _health_cache["ts"] < HEALTH_CACHE_TTL:
+        return _health_cache["value"]
     
-    try:
-        # Test Supabase Storage connection
-        supabase_service.storage.list_buckets()
-        storage_status = "connected"
-    except:
-        storage_status = "disconnected"
+    # Probe Supabase DB and Storage concurrently; any exception marks that service as down
+    db_probe, storage_probe = await asyncio.gather(
+        asyncio.to_thread(supabase.table("detections").select("id").limit(1).execute),
+        asyncio.to_thread(supabase_service.storage.list_buckets),
+        return_exceptions=True
+    )
+    supabase_status = "disconnected" if isinstance(db_probe, BaseException) else "connected"
+    storage_status = "disconnected" if isinstance(storage_probe, BaseException) else "connected"
     
-    return {
+    health = {
         "status": "healthy" if supabase_status == "connected" and storage_status == "connected" else "degraded",
-        "timestamp": datetime.utcnow().isoformat(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
         "services": {
             "supabase_db": supabase_status,
             "supabase_storage": storage_status
         }
     }
+    
+    # Only cache healthy results so a recovery from "degraded" is seen on the next probe
+    if health["status"] == "healthy":
+        _health_cache["ts"] = time.monotonic()
+        _health_cache["value"] = health
+    return health
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,10 @@
+-- Indexes for the detections queries in fast_api.py.
+-- CONCURRENTLY can't run inside a transaction; run these statements one at a time in the SQL editor.
+
+-- GET /detections/{user_id}: WHERE user_id = ? ORDER BY created_at DESC LIMIT 200
+CREATE INDEX CONCURRENTLY IF NOT EXISTS detections_user_created_idx
+  ON detections (user_id, created_at DESC);
+
+-- GET /file/{file_path}: WHERE user_id = ? AND file_path = ? LIMIT 1
+CREATE INDEX CONCURRENTLY IF NOT EXISTS detections_user_filepath_idx
+  ON detections (user_id, file_path);